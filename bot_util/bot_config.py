@@ -1,10 +1,25 @@
 import discord
+import os
+from dataclasses import dataclass
 from pathlib import Path
 from datetime import datetime as dt
 from dotenv import load_dotenv
 import json
 
-load_dotenv("../creds/.env")
+if not os.environ.get("ENV_LOADED"):
+    load_dotenv("creds/.env")
+    os.environ["ENV_LOADED"] = "1"
+
+
+@dataclass(frozen=True)
+class _ApiCreds:
+    wov: str | None
+    lichess: str | None
+
+
+creds = _ApiCreds(
+    wov=os.environ.get("WOV_API_TOKEN"), lichess=os.environ.get("LI_API_TOKEN")
+)
 
 perma_config = json.load(open("./bot_util/bot_config_perma.json", "r"))
 
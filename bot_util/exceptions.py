@@ -13,3 +13,6 @@ class BattleMissingArgumentsError(Exception):
 
 class NotAuthorizedError(CheckFailure):
     pass
+
+class WovQueueError(Exception):
+    """Raised when a Wolvesville API call sent through the shared Redis queue fails on the worker that ran it."""
@@ -0,0 +1,125 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+import orjson
+import redis.asyncio as redis
+
+from bot_util.misc import Logger
+from bot_util import bot_config
+
+
+logger = Logger(__name__, log_file_path=bot_config.LogFiles.functions_log)
+
+# The response cache is opt-in, so a deployment without Redis doesn't try to reach it on every call.
+CACHE_ENABLED = os.getenv("WOV_CACHE_BACKEND") == "redis"
+REDIS_RETRY_AFTER = 30
+
+_redis: redis.Redis | None = None
+_redis_down_until = 0.0
+
+NOT_MODIFIED = object()
+
+
+class CachePolicy:
+    SHORT = 5
+    NORMAL = 20
+    LONG = 45
+
+
+def get_redis() -> redis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    return _redis
+
+
+async def close_redis():
+    global _redis
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
+
+
+def _cache_redis() -> redis.Redis | None:
+    if not CACHE_ENABLED or time.monotonic() < _redis_down_until:
+        return None
+    return get_redis()
+
+
+def _mark_redis_down(error: Exception):
+    global _redis_down_until
+    if time.monotonic() >= _redis_down_until:
+        logger.warning(
+            "Redis unavailable, bypassing the cache for %ss: %s", REDIS_RETRY_AFTER, error
+        )
+    _redis_down_until = time.monotonic() + REDIS_RETRY_AFTER
+
+
+async def _load_uncached(key: str, loader: Callable[[str | None], Awaitable[Any]]) -> Any:
+    try:
+        result = await loader(None)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error("Upstream call failed for %s: %s", key, e)
+        return None
+    return result[0]
+
+
+async def cached(
+    key: str, ttl: int, loader: Callable[[str | None], Awaitable[Any]]
+) -> Any:
+    """Return the cached value for `key`, calling `loader` on a miss.
+
+    `loader` receives the last known ETag (or None) and returns either `NOT_MODIFIED`
+    or a `(body, etag)` tuple. Successful results are stored for `ttl` seconds, plus a
+    copy without expiry under `{key}:stale` which is used for revalidation and served
+    if the upstream errors out or times out.
+    Upstream errors without a stale copy return None. When the cache is disabled or Redis
+    is unavailable, the loader is called directly with the same error handling.
+    """
+    r = _cache_redis()
+    if r is None:
+        return await _load_uncached(key, loader)
+    try:
+        hit = await r.get(key)
+    except redis.RedisError as e:
+        _mark_redis_down(e)
+        return await _load_uncached(key, loader)
+    if hit is not None:
+        return orjson.loads(hit)
+
+    try:
+        stale = await r.get(f"{key}:stale")
+    except redis.RedisError as e:
+        _mark_redis_down(e)
+        stale = None
+    stale = orjson.loads(stale) if stale is not None else None
+
+    try:
+        result = await loader(stale["etag"] if stale else None)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        if stale is None:
+            logger.error("Upstream call failed for %s and no stale value is stored: %s", key, e)
+            return None
+        logger.warning("Upstream call failed for %s, serving stale value: %s", key, e)
+        return stale["body"]
+
+    if result is NOT_MODIFIED:
+        try:
+            await r.set(key, orjson.dumps(stale["body"]), ex=ttl)
+        except redis.RedisError as e:
+            _mark_redis_down(e)
+        return stale["body"]
+
+    body, etag = result
+    if body is not None:
+        try:
+            async with r.pipeline(transaction=False) as pipe:
+                pipe.set(key, orjson.dumps(body), ex=ttl)
+                pipe.set(f"{key}:stale", orjson.dumps({"body": body, "etag": etag}))
+                await pipe.execute()
+        except redis.RedisError as e:
+            _mark_redis_down(e)
+    return body
@@ -1,152 +1,462 @@
 import asyncio
+import copy
 import aiohttp
+import httpx
 import os
-import json
-import requests
+import random
+import socket
+import time
+import uuid
+import orjson
+import redis.asyncio as redis
+import yarl
+from types import MappingProxyType
 from datetime import datetime as dt
 from typing import Any, Callable, Literal
 
-from dotenv import load_dotenv
-
 from bot_util.misc import Logger
-from bot_util.functions.universal import regulated_request
+from bot_util.misc.api_cache import NOT_MODIFIED, CachePolicy, cached, get_redis
+from bot_util.misc.rate_limiter import RedisSlidingWindow, TokenBucket
 from bot_util import bot_config
+from bot_util.exceptions import WovQueueError
 
 
-load_dotenv("creds/.env")
-
 logger = Logger(__name__, log_file_path=bot_config.LogFiles.functions_log)
 
+WOV_WORKER_CONCURRENCY = int(os.getenv("WOV_WORKER_CONCURRENCY", 4))
+
+
+def _orjson_dumps(obj: Any) -> str:
+    # aiohttp expects a str from json_serialize, orjson returns bytes.
+    return orjson.dumps(obj).decode()
+
+
+def _retry_after(response: aiohttp.ClientResponse, default: float) -> float:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return default
+
+
+def _parse_ndjson_batch(lines: list[bytes]) -> list[Any]:
+    return [orjson.loads(line) for line in lines]
+
+
+def _lichess_param(value: Any) -> Any:
+    # Lichess expects lowercase booleans.
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    return value
+
+
+def default_rate_limiter() -> TokenBucket | RedisSlidingWindow:
+    rate = float(os.getenv("WOV_RATE_LIMIT_PER_SEC", 1))
+    burst = int(os.getenv("WOV_RATE_LIMIT_BURST", 5))
+    # The Redis queue spreads calls over several processes, so the limit has to be shared too.
+    if "redis" in (os.getenv("WOV_RATE_LIMITER"), os.getenv("WOV_QUEUE_BACKEND")):
+        return RedisSlidingWindow("wov:ratelimit", limit=burst, window=burst / rate)
+    return TokenBucket(capacity=burst, refill_per_sec=rate)
+
+
 class WovAPICaller:
+    max_restart_delay = 60
+
     def __init__(self):
         self.queue = asyncio.Queue()
-        self.worker = asyncio.create_task(self.process_queue())
+        self.closing = False
+        self.restart_failures = 0
+        self.last_restart = 0.0
+        self.pending_restarts: list[asyncio.TimerHandle] = []
+        self.workers = [self.start_worker() for _ in range(WOV_WORKER_CONCURRENCY)]
+
+    def start_worker(self) -> asyncio.Task:
+        worker = asyncio.create_task(self.process_queue())
+        worker.add_done_callback(self.restart_worker)
+        return worker
+
+    def restart_worker(self, worker: asyncio.Task):
+        if self.closing or worker.cancelled() or worker.exception() is None:
+            return
+        self.workers.remove(worker)
+        # Back off exponentially while workers keep dying, so a persistent failure can't spin the loop.
+        now = time.monotonic()
+        if now - self.last_restart > self.max_restart_delay:
+            self.restart_failures = 0
+        delay = min(2**self.restart_failures, self.max_restart_delay)
+        self.restart_failures += 1
+        self.last_restart = now
+        logger.error(
+            "Wov API worker died, restarting it in %ss", delay, exc_info=worker.exception()
+        )
+        loop = asyncio.get_running_loop()
+        self.pending_restarts = [h for h in self.pending_restarts if h.when() > loop.time()]
+        self.pending_restarts.append(loop.call_later(delay, self.respawn_worker))
+
+    def respawn_worker(self):
+        if not self.closing:
+            self.workers.append(self.start_worker())
 
     async def add_to_queue(self, func: Callable, *args: Any):
-        future = asyncio.Future()
+        future = asyncio.get_running_loop().create_future()
         await self.queue.put((func, args, future))
         return future
 
     async def process_queue(self):
         while True:
-            func, args, future = await self.queue.get()
+            try:
+                func, args, future = await self.queue.get()
+            except asyncio.CancelledError:
+                break
             try:
                 result = await func(*args)
-                future.set_result(result)
+                if not future.done():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                future.cancel()
+                break
             except Exception as e:
-                future.set_exception(e)
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+    async def close(self):
+        self.closing = True
+        for handle in self.pending_restarts:
+            handle.cancel()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        while not self.queue.empty():
+            _, _, future = self.queue.get_nowait()
+            future.cancel()
             self.queue.task_done()
-            await asyncio.sleep(1)  # Respect the rate limit.
+
+class RedisWovAPICaller(WovAPICaller):
+    """WovAPICaller backed by a Redis stream, so every bot process shares one queue and rate limit.
+
+    Calls are queued as `WovApiCall` method names with JSON arguments. Whichever process picks
+    one up pushes the result to `wov:result:<request id>`, where the submitting process waits for it.
+    Delivery is at-least-once: entries a dead process never acknowledged are reclaimed after
+    `claim_idle_ms`, so a call may run twice, which is harmless for these GET-only methods.
+    """
+
+    stream = "wov:queue"
+    group = "wov"
+    result_timeout = 60
+    claim_idle_ms = 30_000
+
+    def __init__(self):
+        self.consumer = f"wov-worker-{socket.gethostname()}-{os.getpid()}"
+        self.waiters: set[asyncio.Task] = set()
+        super().__init__()
+
+    async def add_to_queue(self, func: Callable, *args: Any):
+        if getattr(func, "__self__", None) is not WovApiCall:
+            raise TypeError("Only WovApiCall methods can be sent through the Redis queue")
+        future = asyncio.get_running_loop().create_future()
+        request_id = uuid.uuid4().hex
+        await get_redis().xadd(
+            self.stream, {"id": request_id, "func": func.__name__, "args": orjson.dumps(args)}
+        )
+        waiter = asyncio.create_task(self.wait_for_result(request_id, future))
+        self.waiters.add(waiter)
+        waiter.add_done_callback(self.waiters.discard)
+        return future
+
+    async def wait_for_result(self, request_id: str, future: asyncio.Future):
+        try:
+            reply = await get_redis().blpop(
+                f"wov:result:{request_id}", timeout=self.result_timeout
+            )
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        if future.done():
+            return
+        if reply is None:
+            future.set_exception(asyncio.TimeoutError())
+            return
+        payload = orjson.loads(reply[1])
+        if "error" in payload:
+            future.set_exception(WovQueueError(payload["error"]))
+        else:
+            future.set_result(payload["result"])
+
+    async def ensure_group(self):
+        try:
+            await get_redis().xgroup_create(self.stream, self.group, id="$", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def next_messages(self) -> list[tuple[bytes, dict[bytes, bytes]]]:
+        r = get_redis()
+        # Entries left unacknowledged by a crashed process are picked up again once idle long enough.
+        _, claimed, *_ = await r.xautoclaim(
+            self.stream, self.group, self.consumer, self.claim_idle_ms, count=1
+        )
+        if claimed:
+            return claimed
+        entries = await r.xreadgroup(
+            self.group, self.consumer, {self.stream: ">"}, count=1, block=5000
+        )
+        return [message for _, messages in entries or [] for message in messages]
+
+    async def process_queue(self):
+        failures = 0
+        group_ready = False
+        while True:
+            try:
+                if not group_ready:
+                    await self.ensure_group()
+                    group_ready = True
+                messages = await self.next_messages()
+                failures = 0
+            except asyncio.CancelledError:
+                break
+            except redis.RedisError as e:
+                delay = min(2**failures, self.max_restart_delay)
+                failures += 1
+                logger.warning("Redis queue unavailable, retrying in %ss: %s", delay, e)
+                try:
+                    await asyncio.sleep(delay)
+                except asyncio.CancelledError:
+                    break
+                continue
+            for message_id, fields in messages:
+                await self.handle_message(message_id, fields)
+
+    async def handle_message(self, message_id: bytes, fields: dict[bytes, bytes]):
+        request_id = fields[b"id"].decode()
+        try:
+            func = getattr(WovApiCall, fields[b"func"].decode())
+            payload = {"result": await func(*orjson.loads(fields[b"args"]))}
+        except Exception as e:
+            payload = {"error": repr(e)}
+        try:
+            async with get_redis().pipeline(transaction=True) as pipe:
+                pipe.rpush(f"wov:result:{request_id}", orjson.dumps(payload))
+                pipe.expire(f"wov:result:{request_id}", self.result_timeout)
+                pipe.xack(self.stream, self.group, message_id)
+                pipe.xdel(self.stream, message_id)
+                await pipe.execute()
+        except redis.RedisError as e:
+            # Left unacknowledged, the entry is reclaimed and retried by next_messages.
+            logger.error("Couldn't publish Wov queue result %s: %s", request_id, e)
+
+    async def close(self):
+        await super().close()
+        for waiter in self.waiters:
+            waiter.cancel()
+        await asyncio.gather(*self.waiters, return_exceptions=True)
+
 
 class WovApiCall:
-    headers = {"Authorization": f"Bot {os.getenv('WOV_API_TOKEN')}"}
+    headers = MappingProxyType({"Authorization": f"Bot {bot_config.creds.wov}"})
     api_url = "https://api.wolvesville.com/"
+    _base = yarl.URL(api_url)
+    _session: aiohttp.ClientSession | None = None
+    rate_limiter: TokenBucket | RedisSlidingWindow = default_rate_limiter()
+    max_attempts = 4
+    _inflight: dict[str, asyncio.Task] = {}
+
+    @classmethod
+    async def _get_session(cls) -> aiohttp.ClientSession:
+        if cls._session is None or cls._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=32, limit_per_host=8, ttl_dns_cache=300, keepalive_timeout=60
+            )
+            cls._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=10),
+                json_serialize=_orjson_dumps,
+            )
+        return cls._session
+
+    @classmethod
+    async def close_session(cls):
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+        cls._session = None
+
+    @classmethod
+    def _conditional_headers(cls, etag: str | None):
+        return {**cls.headers, "If-None-Match": etag} if etag else cls.headers
+
+    @classmethod
+    async def _get(
+        cls,
+        path: str,
+        *,
+        ctx: str,
+        ttl: int,
+        detail: tuple[str, Any] | None = None,
+        query: dict | None = None,
+    ) -> Any:
+        """GET `api_url + path` through the Redis cache, returning the parsed JSON or None.
+
+        `detail` is a `(label, value)` pair appended to log messages.
+        Concurrent calls for the same URL share a single upstream request.
+        """
+        log_suffix = " %s: %s" if detail else ""
+        url = cls._base / path
+        if query:
+            url = url.with_query(query)
+
+        async def load(etag: str | None):
+            session = await cls._get_session()
+            for attempt in range(cls.max_attempts):
+                await cls.rate_limiter.acquire()
+                async with session.get(
+                    url=url, headers=cls._conditional_headers(etag)
+                ) as response:
+                    if response.status == 304:
+                        return NOT_MODIFIED
+                    if response.status == 200:
+                        return await response.json(loads=orjson.loads), response.headers.get("ETag")
+                    retryable = response.status == 429 or response.status >= 500
+                    if retryable and attempt == cls.max_attempts - 1:
+                        response.raise_for_status()
+                    if response.status == 429:
+                        delay = _retry_after(response, default=2**attempt)
+                        await cls.rate_limiter.penalize(delay)
+                    elif response.status >= 500:
+                        delay = 2**attempt
+                    else:
+                        logger.error(
+                            "Wov %s API call failed with status code %s." + log_suffix,
+                            ctx,
+                            response.status,
+                            *(detail or ()),
+                        )
+                        return None, None
+                logger.warning(
+                    "Wov %s API call got status code %s, retrying in %ss." + log_suffix,
+                    ctx,
+                    response.status,
+                    delay,
+                    *(detail or ()),
+                )
+                await asyncio.sleep(delay + random.random() * 0.3)
+
+        key = f"wov:{url.raw_path_qs}"
+        task = cls._inflight.get(key)
+        if task is not None:
+            # Coalesced callers get their own copy, as cogs mutate the returned lists.
+            return copy.deepcopy(await asyncio.shield(task))
+        task = asyncio.ensure_future(cached(key, ttl, load))
+        cls._inflight[key] = task
+        task.add_done_callback(lambda _: cls._inflight.pop(key, None))
+        return await asyncio.shield(task)
 
     @classmethod
     async def get_user_by_id(cls, user_id: int):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url=cls.api_url + f"players/{user_id}", headers=cls.headers
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    logger.error(
-                        f"Wov User API call failed with status code {response.status}. User ID: {user_id}"
-                    )
-                    return None
+        return await cls._get(
+            f"players/{user_id}",
+            ctx="User",
+            ttl=CachePolicy.SHORT,
+            detail=("User ID", user_id),
+        )
 
     @classmethod
     async def get_user_by_name(cls, username: str):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url=cls.api_url + f"players/search?username={username}",
-                headers=cls.headers,
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    logger.error(
-                        f"Wov User API call failed with status code {response.status}. Username: {username}"
-                    )
-                    return None
+        return await cls._get(
+            "players/search",
+            query={"username": username},
+            ctx="User",
+            ttl=CachePolicy.SHORT,
+            detail=("Username", username),
+        )
 
     @classmethod
     async def get_clan_by_id(cls, clan_id: int):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url=cls.api_url + f"clans/{clan_id}/info", headers=cls.headers
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    logger.error(
-                        f"Wov Clan API call failed with status code {response.status}. Clan ID: {clan_id}"
-                    )
-                    return None
+        return await cls._get(
+            f"clans/{clan_id}/info",
+            ctx="Clan",
+            ttl=CachePolicy.NORMAL,
+            detail=("Clan ID", clan_id),
+        )
 
     @classmethod
     async def get_clan_by_name(cls, clan_name: str):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url=cls.api_url + f"clans/search?name={clan_name}", headers=cls.headers
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    logger.error(
-                        f"Wov Clan API call failed with status code {response.status}. Clan name: {clan_name}"
-                    )
-                    return None
+        return await cls._get(
+            "clans/search",
+            query={"name": clan_name},
+            ctx="Clan",
+            ttl=CachePolicy.NORMAL,
+            detail=("Clan name", clan_name),
+        )
 
     @classmethod
     async def get_clan_members(cls, clan_id: int):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url=cls.api_url + f"clans/{clan_id}/members", headers=cls.headers
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    logger.error(
-                        f"Wov Clan Members API call failed with status code {response.status}. Clan ID: {clan_id}"
-                    )
-                    return None
+        return await cls._get(
+            f"clans/{clan_id}/members",
+            ctx="Clan Members",
+            ttl=CachePolicy.NORMAL,
+            detail=("Clan ID", clan_id),
+        )
+
+    @classmethod
+    async def get_clan_with_members(cls, clan_id: int):
+        info, members = await asyncio.gather(
+            cls.get_clan_by_id(clan_id), cls.get_clan_members(clan_id)
+        )
+        return {"info": info, "members": members}
 
     @classmethod
     async def get_shop(cls):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url=cls.api_url + "shop/activeOffers", headers=cls.headers
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    logger.error(
-                        "Wov Shop API call failed with status code %s.", response.status
-                    )
-                    return None
+        return await cls._get("shop/activeOffers", ctx="Shop", ttl=CachePolicy.LONG)
 
 class LichessApiCall:
     lichess_url = "https://lichess.org/api/"
-    headers = {"Authorization": f"Bearer {os.getenv('LI_API_TOKEN')}"}
+    _base = yarl.URL(lichess_url)
+    headers = MappingProxyType({"Authorization": f"Bearer {bot_config.creds.lichess}"})
+    _JSON_HEADERS = MappingProxyType({**headers, "Accept": "application/json"})
+    _NDJSON_HEADERS = MappingProxyType({**headers, "Accept": "application/x-ndjson"})
+    _client: httpx.AsyncClient | None = None
+    rate_limit_backoff = 10.0
+    stream_chunk_size = 64 * 1024
+    parse_batch_size = 256
+
+    @classmethod
+    async def _get_client(cls) -> httpx.AsyncClient:
+        # HTTP/2 lets perf lookups share the connection with a running export stream.
+        if cls._client is None or cls._client.is_closed:
+            cls._client = httpx.AsyncClient(
+                http2=True,
+                timeout=httpx.Timeout(30.0, read=60.0),
+                limits=httpx.Limits(max_connections=8, keepalive_expiry=60),
+            )
+        return cls._client
+
+    @classmethod
+    async def close_session(cls):
+        if cls._client is not None and not cls._client.is_closed:
+            await cls._client.aclose()
+        cls._client = None
 
     @classmethod
-    def get_user_performance(cls, username: str, perf_type: str):
-        response = requests.get(
-            url=cls.lichess_url + f"user/{username}/perf/{perf_type}",
-            headers=cls.headers,
+    async def get_user_performance(cls, username: str, perf_type: str):
+        client = await cls._get_client()
+        response = await client.get(
+            str(cls._base / "user" / username / "perf" / perf_type),
+            headers=cls._JSON_HEADERS,
         )
         if response.status_code == 200:
-            return response.json()
+            return orjson.loads(response.content)
         else:
             logger.error(
-                f"Lichess User Performance API call failed with status code {response.status_code}. Username: {username}"
+                "Lichess User Performance API call failed with status code %s. Username: %s",
+                response.status_code,
+                username,
             )
             return None
 
     @classmethod
-    def export_by_player(
+    async def export_by_player(
         cls,
         username: str,
         since: int | dt = None,
@@ -154,7 +464,7 @@ class LichessApiCall:
         limit: int = None,
         vs: str = None,
         rated: bool = None,
-        perf_type: list = None,  # "ultraBullet","bullet","blitz","rapid","classical","correspondence","chess960","crazyhouse","antichess","atomic","horde","kingOfTheHill","racingKings","threeCheck"
+        perf_type: list | str = None,  # "ultraBullet","bullet","blitz","rapid","classical","correspondence","chess960","crazyhouse","antichess","atomic","horde","kingOfTheHill","racingKings","threeCheck"
         color: Literal["white", "black"] = None,
         analysed: bool = None,
         moves: bool = True,
@@ -201,7 +511,13 @@ class LichessApiCall:
             _type_: _description_
         """
 
-        params = {
+        if isinstance(since, dt):
+            since = int(since.timestamp() * 1000)
+        if isinstance(until, dt):
+            until = int(until.timestamp() * 1000)
+        if perf_type and not isinstance(perf_type, str):
+            perf_type = ",".join(perf_type)
+        raw = {
             "since": since,
             "until": until,
             "max": limit,
@@ -223,19 +539,49 @@ class LichessApiCall:
             "lastFen": lastFen,
             "sort": sort,
         }
-        headers = cls.headers
-        headers["Accept"] = "application/x-ndjson"
+        params = {
+            key: _lichess_param(value) for key, value in raw.items() if value is not None
+        }
         try:
-            resp = regulated_request(
-                url=cls.lichess_url + f"games/user/{username}",
-                headers=headers,
-                params=params,
-            )
-            for line in resp.text.splitlines():
-                if line.strip():
-                    yield json.loads(line)
+            client = await cls._get_client()
+            while True:
+                async with client.stream(
+                    "GET",
+                    str(cls._base / "games" / "user" / username),
+                    headers=cls._NDJSON_HEADERS,
+                    params=params,
+                ) as response:
+                    if response.status_code == 429:
+                        logger.warning(
+                            "Lichess rate limit hit, waiting %s seconds", cls.rate_limit_backoff
+                        )
+                        await asyncio.sleep(cls.rate_limit_backoff)
+                        continue
+                    if response.status_code != 200:
+                        logger.error(
+                            "Lichess Export By Player API call failed with status code %s. Username: %s",
+                            response.status_code,
+                            username,
+                        )
+                        return
+                    # Parsing happens in a worker thread, a batch at a time, so large
+                    # exports don't starve the event loop.
+                    buffer, pending = bytearray(), []
+                    async for chunk in response.aiter_bytes(cls.stream_chunk_size):
+                        buffer.extend(chunk)
+                        *lines, rest = buffer.split(b"\n")
+                        buffer = bytearray(rest)
+                        pending.extend(line for line in lines if line.strip())
+                        if len(pending) >= cls.parse_batch_size:
+                            for game in await asyncio.to_thread(_parse_ndjson_batch, pending):
+                                yield game
+                            pending = []
+                    if buffer.strip():
+                        pending.append(buffer)
+                    for game in await asyncio.to_thread(_parse_ndjson_batch, pending):
+                        yield game
+                    return
         except Exception as e:
             logger.error(
-                f"Lichess Export By Player API call failed. Username: {username}. Error: {e}"
+                "Lichess Export By Player API call failed. Username: %s. Error: %s", username, e
             )
-            return None
\ No newline at end of file
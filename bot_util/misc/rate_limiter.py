@@ -0,0 +1,71 @@
+import asyncio
+import math
+import time
+import uuid
+
+from bot_util.misc.api_cache import get_redis
+
+
+class TokenBucket:
+    """In-process token bucket. Allows bursts of up to `capacity` calls, refilling at `refill_per_sec`."""
+
+    def __init__(self, capacity: int, refill_per_sec: float):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.tokens: float = capacity
+        self.last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.refill_per_sec)
+        self.last = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.refill_per_sec)
+
+    async def penalize(self, delay: float):
+        """Empty the bucket and stop refilling it for `delay` seconds, e.g. after a 429."""
+        self.tokens = 0
+        self.last = max(self.last, time.monotonic() + delay)
+
+
+class RedisSlidingWindow:
+    """Sliding-window limiter stored in a Redis sorted set, shared by every process using the same `key`."""
+
+    def __init__(self, key: str, limit: int, window: float):
+        self.key = key
+        self.limit = limit
+        self.window = window
+
+    async def acquire(self):
+        r = get_redis()
+        while True:
+            penalty = await r.pttl(f"{self.key}:penalty")
+            if penalty > 0:
+                await asyncio.sleep(penalty / 1000)
+                continue
+            now = time.time()
+            member = f"{now}:{uuid.uuid4().hex}"
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.zremrangebyscore(self.key, 0, now - self.window)
+                pipe.zadd(self.key, {member: now})
+                pipe.zcard(self.key)
+                pipe.expire(self.key, math.ceil(self.window))
+                _, _, count, _ = await pipe.execute()
+            if count <= self.limit:
+                return
+            await r.zrem(self.key, member)
+            oldest = await r.zrange(self.key, 0, 0, withscores=True)
+            delay = oldest[0][1] + self.window - now if oldest else self.window
+            await asyncio.sleep(max(delay, 0.05))
+
+    async def penalize(self, delay: float):
+        """Block every process sharing this window for `delay` seconds, e.g. after a 429."""
+        await get_redis().set(f"{self.key}:penalty", 1, px=max(int(delay * 1000), 1))
@@ -20,7 +20,6 @@ from db_data.mysql_main import (
     LichessTables as LT,
 )
 import os
-from dotenv import load_dotenv
 import bot_util.bot_config as bot_config
 from bot_util.bot_functions import *
 import traceback
@@ -42,8 +41,7 @@ stream_handler.setFormatter(console_formatter)
 file_handler.setFormatter(formatter)
 logger.addHandler(file_handler)
 
-load_dotenv("creds/.env")
-token = os.getenv("LI_API_TOKEN")
+token = bot_config.creds.lichess
 """
 async def delete_file(num):
     try:
@@ -1312,7 +1310,7 @@ class Chess(commands.Cog):
                     mode = special_modes[mode]
                 playerPerfinfo = LT.get_lichess_perfs(nickname, mode)
                 if not playerPerfinfo:
-                    playerPerfinfo = LichessApiCall.get_user_performance(nickname, mode)
+                    playerPerfinfo = await LichessApiCall.get_user_performance(nickname, mode)
                     if not playerPerfinfo:
                         embed = discord.Embed(
                             title=_("Couldn't find any user with that username"),
@@ -1326,7 +1324,7 @@ class Chess(commands.Cog):
                     if datetimefix.strptime(
                         playerPerfinfo["json_data"]["time_cached"], "%Y-%m-%d %H:%M:%S"
                     ) < datetimefix.utcnow() - datetime.timedelta(days=7):
-                        playerPerfinfo = LichessApiCall.get_user_performance(
+                        playerPerfinfo = await LichessApiCall.get_user_performance(
                             nickname, mode
                         )
                         if not playerPerfinfo:
@@ -1871,7 +1869,7 @@ class Chess(commands.Cog):
                             nickname, clocks=True, literate=True, opening=True, limit=10
                         )
                         game_ids, game_list = [], []
-                        for game in game_list_exp:
+                        async for game in game_list_exp:
                             LT.store_lichess_game(game)
                             game_ids.append(game["id"])
                             game_list.append(game)
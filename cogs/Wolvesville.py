@@ -1,4 +1,5 @@
 import calendar
+import os
 from functools import cache
 import discord
 import logging
@@ -17,6 +18,7 @@ from bot_util.bot_functions import (
     WovApiCall,
     WolvesvilleFunctions as WovFunc,
 )
+from bot_util.misc.api_callers import RedisWovAPICaller
 from db_data.mysql_main import DatabaseFunctions as DF, JsonOperating as JO
 import bot_util.bot_config as cfg
 from pathlib import Path
@@ -74,14 +76,12 @@ class WovClan(discord.ui.View):
                     ).format(timeleft=pretty_time_delta(3600 - time_diff))
                 )
             else:
-                self.json_data = await self.api_caller.add_to_queue(
-                    WovApiCall.get_clan_by_id, self.json_data["id"]
+                clan_with_members = await self.api_caller.add_to_queue(
+                    WovApiCall.get_clan_with_members, self.json_data["id"]
                 )
-                self.json_data = await self.json_data
-                member_list = await self.api_caller.add_to_queue(
-                    WovApiCall.get_clan_members, self.json_data["id"]
-                )
-                member_list = await member_list
+                clan_with_members = await clan_with_members
+                self.json_data = clan_with_members["info"]
+                member_list = clan_with_members["members"]
                 description = self.json_data["description"]
                 DF.json_caching("clan", self.json_data)
                 DF.json_caching("clan_members", member_list, self.json_data["id"])
@@ -488,11 +488,18 @@ class Wolvesville(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.api_url = "https://api.wolvesville.com/"
-        self.api_caller = APICaller()
+        self.api_caller = (
+            RedisWovAPICaller()
+            if os.getenv("WOV_QUEUE_BACKEND") == "redis"
+            else APICaller()
+        )
 
     async def cog_load(self):
         print("Wolvesville cog loaded successfully!")
 
+    async def cog_unload(self):
+        await self.api_caller.close()
+
     @commands.command(aliases=["wov-clan", "w-clan", "wov-c", "wovc", "w-c"])
     async def wovclan(self, ctx, *, clan_name: str = None):
         async with AsyncTranslator(
@@ -520,9 +527,8 @@ class Wolvesville(commands.Cog):
                 logger.info(
                     f'Couldn\'t find "{logger_clan_name}" in cache. Making an API call.'
                 )
-                clan_name_search = re.sub("\s", "%20", clan_name)
                 clan_dict = await self.api_caller.add_to_queue(
-                    WovApiCall.get_clan_by_name, clan_name_search
+                    WovApiCall.get_clan_by_name, clan_name
                 )
                 clan_dict = await clan_dict
                 if len(clan_dict) == 0 or clan_dict is None:
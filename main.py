@@ -25,7 +25,6 @@ import psutil
 import discord
 from discord.ext import commands
 from discord import app_commands
-from dotenv import load_dotenv
 from bot_util import exceptions
 from bot_util.converters import MembersOrRoles
 from bot_util.functions.bot import determine_prefix
@@ -35,6 +34,8 @@ from bot_util.functions.universal import chance, pretty_date
 import bot_util.bot_config as b_cfg
 from bot_util.bot_config import IS_DEV_BUILD
 from bot_util.misc import AsyncTranslator, BotStringsReader, WebSocketClient, Logger
+from bot_util.misc.api_cache import close_redis
+from bot_util.misc.api_callers import LichessApiCall, WovApiCall
 from telegram_helper.main import MifTelegramReporter
 from db_data.database_main import PrefixDatabase
 from db_data import psql_main
@@ -103,6 +104,13 @@ class Mif(commands.Bot):
         )
         await self.close()
 
+    async def close(self):
+        # Unloading the cogs stops the Wov API workers, so the shared clients are closed after that.
+        await super().close()
+        await WovApiCall.close_session()
+        await LichessApiCall.close_session()
+        await close_redis()
+
     async def on_command_error(self, ctx: commands.Context, error: Exception) -> None:
         if hasattr(ctx.command, "on_error"):
             return
@@ -175,7 +183,6 @@ class Mif(commands.Bot):
 
 bot = Mif()
 
-load_dotenv("creds/.env")
 token = os.getenv("TOKEN" if IS_DEV_BUILD else "TOKEN_MIF")
 
 